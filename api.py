@@ -0,0 +1,341 @@
+"""API HTTP do MEDIX para sistemas externos (ex: o checkout da loja online), sem passar pelo Streamlit.
+
+Uso:
+    python api.py
+    python api.py --porta 8600 --armazenamento local --diretorio dados_api
+
+Rotas (JSON):
+    GET  /saude      estado do armazenamento e alterações aguardando sincronização
+    GET  /produtos   produtos ativos
+    GET  /vendas     vendas com a data_registro e o cliente pedidos (?data_registro=...&cliente=...)
+    POST /vendas     uma venda ou uma lista de vendas
+    POST /pedidos    um pedido: dados do cliente e uma lista de itens (produto_id, quantidade)
+
+Cada venda tem produto_id, cliente, quantidade e forma_pagamento e, opcionalmente, cpf,
+email e data_compra. Com a variável de ambiente MEDIX_API_TOKEN definida, as requisições
+precisam do cabeçalho "Authorization: Bearer <token>".
+
+A resposta traz o ID e a data de registro de cada venda gravada. No modo híbrido o ID é
+provisório: se outra sessão usar o mesmo ID na planilha antes da sincronização, a venda é
+renumerada. O que identifica a venda de forma estável é a data de registro com o cliente (os
+mesmos campos com que a sincronização reconhece a venda); GET /vendas devolve o ID atual.
+
+Para poder repetir uma requisição sem duplicar vendas, envie o cabeçalho "Idempotency-Key"
+(em /pedidos, o campo pedido_id também serve): a mesma chave devolve o resultado da primeira
+requisição, ou espera por ele se o lote ainda estiver sendo gravado. Se o lote demorar mais
+que 30 segundos (ESPERA_LOTE_API), a resposta é 202 (vendas ainda em gravação), não um erro.
+
+As vendas que chegam ao mesmo tempo (de várias conexões) entram numa fila e são gravadas
+juntas, com uma única gravação dos arquivos por lote. As conexões são mantidas abertas
+(HTTP/1.1 keep-alive) e a lista de produtos fica em memória até os dados mudarem.
+
+No modo híbrido (padrão) a API usa uma pasta própria e sincroniza com o Google Sheets como
+o aplicativo; não aponte a API e o aplicativo para a mesma pasta local ao mesmo tempo.
+"""
+import argparse
+import hmac
+import json
+import logging
+import os
+import queue
+import socket
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from urllib.parse import parse_qs, urlsplit
+
+from app import ESQUEMA_VENDAS, formatar_datas, registros_dataframe
+from migracao import abrir_gestao
+
+DIRETORIO_API = 'dados_api'
+PORTA_API = 8600
+# Vendas por gravação em lote e tempo máximo (em segundos) que uma requisição espera o lote dela
+TAMANHO_LOTE_API = 500
+ESPERA_LOTE_API = 30
+# Chaves de idempotência lembradas (as mais antigas são descartadas)
+LIMITE_CHAVES_API = 10000
+CAMPOS_OBRIGATORIOS = ['produto_id', 'cliente', 'quantidade', 'forma_pagamento']
+
+class ErroRequisicao(Exception):
+    """Requisição com JSON ou campos inválidos (resposta 400)."""
+
+def venda_da_requisicao(dados):
+    """Converte uma venda recebida em JSON nos argumentos de registrar_venda."""
+    if not isinstance(dados, dict):
+        raise ErroRequisicao("Cada venda deve ser um objeto JSON")
+    faltando = [campo for campo in CAMPOS_OBRIGATORIOS if dados.get(campo) in (None, "")]
+    if faltando:
+        raise ErroRequisicao(f"Campos obrigatórios ausentes: {', '.join(faltando)}")
+    try:
+        produto_id, quantidade = int(dados['produto_id']), int(dados['quantidade'])
+    except (TypeError, ValueError):
+        raise ErroRequisicao("produto_id e quantidade devem ser números inteiros")
+    if quantidade < 1:
+        raise ErroRequisicao("quantidade deve ser maior que zero")
+    return {
+        'produto_id': produto_id, 'cliente': str(dados['cliente']), 'cpf': str(dados.get('cpf') or ""),
+        'email': str(dados.get('email') or ""), 'quantidade': quantidade,
+        'forma_pagamento': str(dados['forma_pagamento']), 'data_compra': dados.get('data_compra') or None
+    }
+
+class LoteVendas:
+    """Junta as vendas que chegam de várias requisições e as grava em lotes por uma única thread.
+    
+    Cada requisição põe as vendas dela na fila e espera o resultado; a thread pega tudo o que
+    estiver na fila (até TAMANHO_LOTE_API vendas) e chama registrar_vendas uma vez.
+    """
+    
+    def __init__(self, gestao, tamanho_lote=TAMANHO_LOTE_API):
+        self.gestao = gestao
+        self.tamanho_lote = tamanho_lote
+        self.fila = queue.Queue()
+        self.thread = threading.Thread(target=self.executar, name="medix-api-lotes", daemon=True)
+        self.thread.start()
+    
+    def enviar(self, vendas):
+        """Entrega as vendas ao próximo lote e retorna o pedido, para esperar com aguardar."""
+        pedido = {'vendas': vendas, 'resultados': None, 'pronto': threading.Event()}
+        self.fila.put(pedido)
+        return pedido
+    
+    @staticmethod
+    def aguardar(pedido, espera=ESPERA_LOTE_API):
+        """Retorna [{'id', 'data_registro', 'erro'}] na ordem das vendas, ou None se o lote ainda não terminou."""
+        if not pedido['pronto'].wait(espera):
+            return None
+        if isinstance(pedido['resultados'], Exception):
+            raise pedido['resultados']
+        return pedido['resultados']
+    
+    def executar(self):
+        while True:
+            pedidos = [self.fila.get()]
+            total = len(pedidos[0]['vendas'])
+            while total < self.tamanho_lote:
+                try:
+                    pedido = self.fila.get_nowait()
+                except queue.Empty:
+                    break
+                pedidos.append(pedido)
+                total += len(pedido['vendas'])
+            
+            try:
+                resultados = self.identificar(self.gestao.registrar_vendas([venda for pedido in pedidos for venda in pedido['vendas']]))
+                for pedido in pedidos:
+                    pedido['resultados'], resultados = resultados[:len(pedido['vendas'])], resultados[len(pedido['vendas']):]
+            except Exception as e:
+                logging.error(f"Erro ao gravar lote de vendas da API: {e}")
+                for pedido in pedidos:
+                    pedido['resultados'] = e
+            for pedido in pedidos:
+                pedido['pronto'].set()
+    
+    def identificar(self, resultados):
+        """Junta a cada venda gravada a data de registro, que com o cliente a identifica mesmo se o ID mudar."""
+        ids = [id for id, _ in resultados if id]
+        datas = {}
+        try:
+            if ids:
+                vendas = self.gestao.listar_vendas(colunas=['id', 'data_registro'])
+                vendas = formatar_datas(vendas[vendas['id'].isin(ids)], ESQUEMA_VENDAS)
+                datas = dict(zip(vendas['id'], vendas['data_registro']))
+        except Exception as e:
+            # As vendas já foram gravadas: o lote não pode ser dado como falho (seria gravado de novo)
+            logging.warning(f"Erro ao obter a data de registro das vendas da API: {e}")
+        return [{'id': id, 'data_registro': datas.get(id), 'erro': erro} for id, erro in resultados]
+
+class ServicoVendas:
+    """Regras das rotas, separadas do HTTP: listagem de produtos em cache e registro em lote."""
+    
+    def __init__(self, gestao, token=None):
+        self.gestao = gestao
+        self.token = token
+        self.lotes = LoteVendas(gestao)
+        # (versão dos dados, resposta JSON já serializada)
+        self._produtos = None
+        self._lock = threading.Lock()
+        # Chave de idempotência -> pedido entregue ao lote
+        self._pedidos = OrderedDict()
+        self._lock_pedidos = threading.Lock()
+    
+    def produtos(self):
+        versao = self.gestao.versao_dados()
+        with self._lock:
+            if self._produtos is None or self._produtos[0] != versao:
+                produtos = self.gestao.listar_produtos(colunas=['id', 'nome', 'tipo', 'valor', 'quantidade', 'descricao'])
+                self._produtos = (versao, json.dumps({'produtos': registros_dataframe(produtos)}, ensure_ascii=False).encode())
+            return self._produtos[1]
+    
+    def saude(self):
+        return {
+            'status': 'ok',
+            'armazenamento': type(self.gestao).__name__,
+            'conectado': getattr(self.gestao, 'conectado', None),
+            'pendentes': self.gestao.pendentes() if hasattr(self.gestao, 'pendentes') else 0
+        }
+    
+    def registrar(self, vendas, chave=None):
+        """Entrega as vendas ao lote, reaproveitando o pedido de uma requisição anterior com a mesma chave."""
+        with self._lock_pedidos:
+            pedido = self._pedidos.get(chave) if chave else None
+            if pedido is None:
+                pedido = self.lotes.enviar(vendas)
+                if chave:
+                    self._pedidos[chave] = pedido
+                    while len(self._pedidos) > LIMITE_CHAVES_API:
+                        self._pedidos.popitem(last=False)
+        try:
+            return LoteVendas.aguardar(pedido)
+        except Exception:
+            # Lote com erro: uma nova tentativa com a mesma chave deve gravar de novo
+            with self._lock_pedidos:
+                if chave and self._pedidos.get(chave) is pedido:
+                    del self._pedidos[chave]
+            raise
+    
+    def vendas(self, dados, chave=None):
+        """Registra uma venda (objeto) ou várias (lista); retorna (status HTTP, resposta)."""
+        if not isinstance(dados, (dict, list)):
+            raise ErroRequisicao("Envie uma venda (objeto JSON) ou uma lista de vendas")
+        unica = isinstance(dados, dict)
+        vendas = [venda_da_requisicao(venda) for venda in ([dados] if unica else dados)]
+        if not vendas:
+            raise ErroRequisicao("Nenhuma venda enviada")
+        resultados = self.registrar(vendas, chave)
+        if resultados is None:
+            return 202, {'status': "Vendas recebidas e ainda em gravação", 'chave': chave}
+        if unica:
+            return (201 if resultados[0]['id'] else 422), resultados[0]
+        registradas = sum(1 for resultado in resultados if resultado['id'])
+        return 200, {'registradas': registradas, 'falhas': len(resultados) - registradas, 'vendas': resultados}
+    
+    def consultar(self, parametros):
+        """Vendas com a data de registro e o cliente informados, com o ID atual de cada uma."""
+        data_registro, cliente = parametros.get('data_registro'), parametros.get('cliente')
+        if not data_registro or not cliente:
+            raise ErroRequisicao("Informe data_registro e cliente")
+        vendas = self.gestao.listar_vendas(colunas=['id', 'produto_id', 'produto_nome', 'cliente', 'quantidade',
+                                                    'valor_total', 'data_registro', 'data_compra', 'status'])
+        vendas = formatar_datas(vendas[vendas['cliente'] == cliente], ESQUEMA_VENDAS)
+        vendas = vendas[vendas['data_registro'] == data_registro]
+        return (200 if not vendas.empty else 404), {'vendas': registros_dataframe(vendas)}
+    
+    def pedido(self, dados, chave=None):
+        """Registra os itens de um pedido como vendas do mesmo cliente, no mesmo lote."""
+        if not isinstance(dados, dict) or not isinstance(dados.get('itens'), list) or not dados['itens']:
+            raise ErroRequisicao("O pedido deve ter uma lista de itens")
+        cliente = {campo: dados.get(campo) for campo in ['cliente', 'cpf', 'email', 'forma_pagamento', 'data_compra']}
+        itens = [dict(cliente, **item) if isinstance(item, dict) else item for item in dados['itens']]
+        if not chave and dados.get('pedido_id') not in (None, ""):
+            chave = f"pedido {dados['pedido_id']}"
+        status, resposta = self.vendas(itens, chave)
+        if status == 202:
+            return status, resposta
+        return (201 if not resposta['falhas'] else 422), resposta
+
+def criar_handler(servico):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1: a conexão fica aberta entre requisições (keep-alive)
+        protocol_version = "HTTP/1.1"
+        
+        def setup(self):
+            super().setup()
+            # Cabeçalhos e corpo saem em escritas separadas: sem isso o Nagle segura a resposta
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        
+        def log_message(self, formato, *args):
+            logging.debug(f"API {self.address_string()} {formato % args}")
+        
+        def responder(self, status, corpo):
+            if not isinstance(corpo, bytes):
+                corpo = json.dumps(corpo, ensure_ascii=False, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+        
+        def autorizado(self):
+            recebido = (self.headers.get("Authorization") or "").encode()
+            if servico.token and not hmac.compare_digest(recebido, f"Bearer {servico.token}".encode()):
+                self.responder(401, {'erro': "Token inválido ou ausente"})
+                return False
+            return True
+        
+        def do_GET(self):
+            if not self.autorizado():
+                return
+            url = urlsplit(self.path)
+            if url.path == "/saude":
+                self.responder(200, servico.saude())
+            elif url.path == "/produtos":
+                self.responder(200, servico.produtos())
+            elif url.path == "/vendas":
+                parametros = {nome: valores[-1] for nome, valores in parse_qs(url.query).items()}
+                try:
+                    self.responder(*servico.consultar(parametros))
+                except ErroRequisicao as e:
+                    self.responder(400, {'erro': str(e)})
+            else:
+                self.responder(404, {'erro': "Rota não encontrada"})
+        
+        def do_POST(self):
+            # O corpo é lido antes de qualquer resposta para não deixar bytes na conexão aberta
+            try:
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                if tamanho < 0:
+                    raise ValueError(tamanho)
+            except ValueError:
+                # Sem saber o tamanho do corpo não dá para reaproveitar a conexão
+                self.close_connection = True
+                self.responder(400, {'erro': "Content-Length inválido"})
+                return
+            corpo = self.rfile.read(tamanho)
+            if not self.autorizado():
+                return
+            rotas = {"/vendas": servico.vendas, "/pedidos": servico.pedido}
+            if self.path not in rotas:
+                self.responder(404, {'erro': "Rota não encontrada"})
+                return
+            try:
+                self.responder(*rotas[self.path](json.loads(corpo or b"null"), self.headers.get("Idempotency-Key") or None))
+            except (json.JSONDecodeError, ErroRequisicao) as e:
+                self.responder(400, {'erro': str(e)})
+            except Exception as e:
+                logging.error(f"Erro na API em {self.path}: {e}")
+                self.responder(500, {'erro': "Erro interno ao registrar as vendas"})
+    
+    return Handler
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="API HTTP do MEDIX para registrar vendas de sistemas externos.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=PORTA_API)
+    parser.add_argument('--armazenamento', choices=['hibrido', 'local', 'parquet'], default='hibrido')
+    parser.add_argument('--diretorio', default=DIRETORIO_API, help="Pasta dos arquivos locais da API")
+    args = parser.parse_args(argumentos)
+    
+    try:
+        gestao = abrir_gestao(args.armazenamento, args.diretorio)
+    except Exception as e:
+        logging.error(f"Erro ao abrir o armazenamento da API: {e}")
+        return 1
+    
+    token = os.environ.get('MEDIX_API_TOKEN')
+    if not token:
+        logging.warning("MEDIX_API_TOKEN não definido: a API aceita requisições sem autenticação")
+    servidor = ThreadingHTTPServer((args.host, args.porta), criar_handler(ServicoVendas(gestao, token)))
+    servidor.daemon_threads = True
+    logging.info(f"API do MEDIX em http://{args.host}:{args.porta}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
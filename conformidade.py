@@ -0,0 +1,309 @@
+"""Kit de conformidade e desempenho dos armazenamentos de produtos e vendas.
+
+Uso:
+    python conformidade.py local
+    python conformidade.py parquet
+    python conformidade.py hibrido
+    python conformidade.py sheets --confirmar
+
+Todo armazenamento (ver ArmazenamentoVendas em app.py) precisa passar pelas mesmas
+verificações: o estoque ao registrar, editar e remover vendas, as recusas sem efeito
+colateral, as reservas e vendas simultâneas das últimas unidades, a troca de status em lote
+e um orçamento de tempo e de chamadas por operação. Local e Parquet rodam numa pasta
+temporária; no Google Sheets os registros de teste vão para a planilha real e são
+marcados como removidos no final. O modo híbrido (o do aplicativo) roda numa pasta
+temporária sem conectar à planilha: as escritas ficam na fila de sincronização.
+"""
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import app
+from app import ArmazenamentoVendas, GestaoVendasGoogleSheets, TabelaParquet
+from migracao import abrir_gestao
+
+# Orçamento de cada operação: (segundos, chamadas). Chamadas são gravações de arquivo nos
+# armazenamentos locais e requisições às abas da planilha no Google Sheets.
+ORCAMENTOS = {
+    'local': {
+        'cadastrar_produto': (0.2, 2), 'registrar_venda': (0.2, 2), 'editar_venda': (0.2, 2),
+        'remover_venda': (0.2, 2), 'listar_produtos': (0.2, 0), 'listar_vendas': (0.2, 0)
+    },
+    'parquet': {
+        'cadastrar_produto': (0.3, 2), 'registrar_venda': (0.3, 2), 'editar_venda': (0.5, 4),
+        'remover_venda': (0.5, 4), 'listar_produtos': (0.3, 0), 'listar_vendas': (0.3, 0)
+    },
+    'hibrido': {
+        'cadastrar_produto': (0.2, 3), 'registrar_venda': (0.2, 3), 'editar_venda': (0.2, 3),
+        'remover_venda': (0.2, 3), 'listar_produtos': (0.2, 0), 'listar_vendas': (0.2, 0)
+    },
+    'sheets': {
+        'cadastrar_produto': (5.0, 4), 'registrar_venda': (5.0, 6), 'editar_venda': (5.0, 8),
+        'remover_venda': (5.0, 6), 'listar_produtos': (3.0, 2), 'listar_vendas': (3.0, 2)
+    }
+}
+
+class HibridaDesconectada(app.GestaoVendasHibrida):
+    """Modo híbrido que nunca conecta ao Google Sheets: o kit não grava na planilha real."""
+    
+    def conectar(self):
+        return False
+
+def contado(funcao, contagem):
+    """Envolve a função somando 1 à contagem a cada chamada."""
+    def chamar(*args, **kwargs):
+        contagem[0] += 1
+        return funcao(*args, **kwargs)
+    return chamar
+
+class ChamadasContadas:
+    """Repassa tudo ao objeto original, contando as chamadas de métodos."""
+    
+    def __init__(self, alvo, contagem):
+        self._alvo = alvo
+        self._contagem = contagem
+    
+    def __getattr__(self, nome):
+        atributo = getattr(self._alvo, nome)
+        return contado(atributo, self._contagem) if callable(atributo) else atributo
+
+@contextmanager
+def contar_chamadas(gestao):
+    """Conta as gravações de arquivo (local/Parquet) ou as requisições às abas (Google Sheets) feitas no bloco."""
+    contagem = [0]
+    if isinstance(gestao, GestaoVendasGoogleSheets):
+        abas = gestao.produtos_sheet, gestao.vendas_sheet
+        gestao.produtos_sheet = ChamadasContadas(abas[0], contagem)
+        gestao.vendas_sheet = ChamadasContadas(abas[1], contagem)
+        try:
+            yield contagem
+        finally:
+            gestao.produtos_sheet, gestao.vendas_sheet = abas
+        return
+    
+    gravar_arquivo = app.gravar_arquivo
+    app.gravar_arquivo = contado(gravar_arquivo, contagem)
+    # No modo híbrido as partições Parquet são as do armazenamento local dele
+    vendas = getattr(getattr(gestao, 'local', gestao), 'vendas', None)
+    particoes = isinstance(vendas, TabelaParquet)
+    if particoes:
+        vendas._escrever = contado(vendas._escrever, contagem)
+    try:
+        yield contagem
+    finally:
+        app.gravar_arquivo = gravar_arquivo
+        if particoes:
+            del vendas._escrever
+
+@contextmanager
+def falhar_gravacoes():
+    """Faz toda gravação de arquivo falhar no bloco, como num disco cheio."""
+    gravar_arquivo = app.gravar_arquivo
+    def falhar(arquivo, conteudo):
+        raise OSError(28, "Disco cheio (simulado pelo kit)")
+    app.gravar_arquivo = falhar
+    try:
+        yield
+    finally:
+        app.gravar_arquivo = gravar_arquivo
+
+class Kit:
+    """Executa as operações medindo tempo e chamadas e guarda o resultado de cada verificação."""
+    
+    def __init__(self, gestao, orcamento):
+        self.gestao = gestao
+        self.orcamento = orcamento
+        self.verificacoes = []
+        self.medicoes = {}
+    
+    def medir(self, operacao, *args, **kwargs):
+        with contar_chamadas(self.gestao) as contagem:
+            inicio = time.perf_counter()
+            resultado = getattr(self.gestao, operacao)(*args, **kwargs)
+            segundos = time.perf_counter() - inicio
+        medicoes = self.medicoes.setdefault(operacao, [])
+        medicoes.append((segundos, contagem[0]))
+        return resultado
+    
+    def verificar(self, nome, condicao, detalhe=""):
+        self.verificacoes.append((nome, bool(condicao), detalhe))
+    
+    def verificar_orcamentos(self):
+        for operacao, medicoes in self.medicoes.items():
+            if operacao not in self.orcamento:
+                continue
+            limite_segundos, limite_chamadas = self.orcamento[operacao]
+            segundos = max(m[0] for m in medicoes)
+            chamadas = max(m[1] for m in medicoes)
+            self.verificar(f"orçamento de {operacao}", segundos <= limite_segundos and chamadas <= limite_chamadas,
+                           f"pior caso {segundos * 1000:.0f} ms / {chamadas} chamadas "
+                           f"(limite {limite_segundos * 1000:.0f} ms / {limite_chamadas})")
+    
+    @property
+    def aprovado(self):
+        return all(ok for _, ok, _ in self.verificacoes)
+    
+    def imprimir(self):
+        for nome, ok, detalhe in self.verificacoes:
+            print(f"{'OK   ' if ok else 'FALHA'} {nome}{f' — {detalhe}' if detalhe else ''}")
+        falhas = sum(1 for _, ok, _ in self.verificacoes if not ok)
+        print(f"{len(self.verificacoes) - falhas} de {len(self.verificacoes)} verificações aprovadas")
+
+def estoque(gestao, produto_id):
+    produtos = gestao.listar_produtos(colunas=['id', 'quantidade'])
+    return int(produtos.loc[produtos['id'] == produto_id, 'quantidade'].iloc[0])
+
+def executar_kit(gestao, orcamento):
+    """Roda o roteiro de verificações no armazenamento e retorna o Kit com os resultados."""
+    kit = Kit(gestao, orcamento)
+    prefixo = f"conformidade-{uuid.uuid4().hex[:6]}"
+    kit.verificar("implementa ArmazenamentoVendas", isinstance(gestao, ArmazenamentoVendas))
+    
+    try:
+        kit.medir('cadastrar_produto', f"{prefixo} A", 'Card', 10.0, 10)
+        kit.medir('cadastrar_produto', f"{prefixo} B", 'Material Físico', 5.0, 4)
+        kit.medir('cadastrar_produto', f"{prefixo} PDF", 'PDF', 20.0)
+        produtos = kit.medir('listar_produtos', colunas=['id', 'nome'])
+        ids = dict(zip(produtos['nome'], produtos['id']))
+        a, b, pdf = ids[f"{prefixo} A"], ids[f"{prefixo} B"], ids[f"{prefixo} PDF"]
+        versao = gestao.versao_dados()
+        
+        # Registro: a data de compra pode vir como date, datetime ou texto
+        ok = kit.medir('registrar_venda', a, f"{prefixo} cliente 1", "", "c1@medix", 3, "Pix", date(2024, 1, 15))
+        kit.verificar("registrar_venda baixa o estoque", ok and estoque(gestao, a) == 7, gestao.ultimo_erro or "")
+        kit.medir('registrar_venda', pdf, f"{prefixo} cliente 2", "", "c2@medix", 2, "Pix", datetime(2024, 2, 1, 10, 30))
+        kit.verificar("venda de produto digital não altera estoque", estoque(gestao, pdf) == 0)
+        kit.medir('registrar_venda', a, f"{prefixo} cliente 3", "", "c3@medix", 1, "Pix", "2024-03-10")
+        kit.verificar("versao_dados muda após uma escrita", gestao.versao_dados() != versao)
+        
+        vendas = kit.medir('listar_vendas')
+        vendas = vendas[vendas['cliente'].str.startswith(prefixo)].set_index('cliente')
+        datas = [vendas.loc[f"{prefixo} cliente {i}", 'data_compra'].strftime("%Y-%m-%d") for i in (1, 2, 3)]
+        kit.verificar("data de compra aceita date, datetime e texto", datas == ['2024-01-15', '2024-02-01', '2024-03-10'],
+                      str(datas))
+        kit.verificar("valor total = valor unitário × quantidade", vendas.loc[f"{prefixo} cliente 1", 'valor_total'] == 30)
+        v1, v2, v3 = (int(vendas.loc[f"{prefixo} cliente {i}", 'id']) for i in (1, 2, 3))
+        
+        ok = kit.medir('registrar_venda', a, f"{prefixo} cliente 4", "", "c4@medix", 50, "Pix", "2024-03-11")
+        kit.verificar("venda acima do estoque é recusada sem alterar nada",
+                      not ok and estoque(gestao, a) == 6 and gestao.ultimo_erro, gestao.ultimo_erro or "")
+        
+        # Reservas: as unidades reservadas por outra sessão (outro caixa) não podem ser vendidas
+        disponivel = gestao.reservar_estoque(a, 6, f"{prefixo} caixa 1")
+        ok = kit.medir('registrar_venda', a, f"{prefixo} cliente 5", "", "c5@medix", 1, "Pix", "2024-03-12",
+                       reserva=f"{prefixo} caixa 2")
+        kit.verificar("estoque reservado por outra sessão não pode ser vendido",
+                      disponivel == 6 and not ok and estoque(gestao, a) == 6, gestao.ultimo_erro or "")
+        gestao.liberar_reserva(a, f"{prefixo} caixa 1")
+        
+        # Edição: a quantidade anterior volta ao produto anterior e a nova sai do produto escolhido
+        ok = kit.medir('editar_venda', v1, a, f"{prefixo} cliente 1", "", "c1@medix", 5, "Pix", "2024-01-15")
+        kit.verificar("editar_venda no mesmo produto ajusta pela diferença", ok and estoque(gestao, a) == 4)
+        ok = kit.medir('editar_venda', v1, b, f"{prefixo} cliente 1", "", "c1@medix", 2, "Pix", "2024-01-15")
+        kit.verificar("editar_venda para outro produto devolve e baixa os estoques",
+                      ok and (estoque(gestao, a), estoque(gestao, b)) == (9, 2))
+        ok = kit.medir('editar_venda', v1, a, f"{prefixo} cliente 1", "", "c1@medix", 50, "Pix", "2024-01-15")
+        kit.verificar("edição acima do estoque é recusada sem alterar nada",
+                      not ok and (estoque(gestao, a), estoque(gestao, b)) == (9, 2), gestao.ultimo_erro or "")
+        ok = kit.medir('editar_venda', v1, pdf, f"{prefixo} cliente 1", "", "c1@medix", 1, "Pix", "2024-01-15")
+        kit.verificar("editar_venda para produto digital devolve o estoque do anterior", ok and estoque(gestao, b) == 4)
+        
+        # Remoção: a quantidade volta ao estoque e a venda some das listagens
+        ok = kit.medir('remover_venda', v3)
+        vendas = kit.medir('listar_vendas', colunas=['id'])
+        kit.verificar("remover_venda devolve o estoque", ok and estoque(gestao, a) == 10)
+        kit.verificar("venda removida sai da listagem", v3 not in set(vendas['id']))
+        kit.verificar("remover venda já removida falha", not kit.medir('remover_venda', v3))
+        kit.verificar("produto com vendas não pode ser removido", not gestao.remover_produto(pdf))
+        
+        # Falha ao gravar os arquivos: a escrita é recusada e nada muda em memória
+        if not isinstance(gestao, GestaoVendasGoogleSheets):
+            antes = gestao.listar_vendas(colunas=['id', 'produto_id', 'quantidade', 'status'])
+            with falhar_gravacoes():
+                falhas = [gestao.registrar_venda(a, f"{prefixo} cliente 6", "", "c6@medix", 2, "Pix", "2024-03-13"),
+                          gestao.editar_venda(v1, a, f"{prefixo} cliente 1", "", "c1@medix", 3, "Pix", "2024-01-15"),
+                          gestao.remover_venda(v2)]
+            depois = gestao.listar_vendas(colunas=['id', 'produto_id', 'quantidade', 'status'])
+            kit.verificar("falha ao gravar os arquivos não altera os dados em memória",
+                          not any(falhas) and estoque(gestao, a) == 10 and depois.equals(antes), str(falhas))
+        
+        periodo = gestao.listar_vendas(colunas=['cliente'], periodo=('2024-02-01', '2024-02-29'))
+        kit.verificar("listar_vendas filtra pelo período da data de compra",
+                      [c for c in periodo['cliente'] if c.startswith(prefixo)] == [f"{prefixo} cliente 2"])
+        
+        # Status em lote (entregas digitais): só o status muda; vendas removidas ficam de fora e as demais
+        # são atualizadas (as entregas delas já foram enviadas)
+        ok = gestao.atualizar_status_vendas({v2: app.STATUS_ENTREGUE})
+        vendas = gestao.listar_vendas(colunas=['id', 'cliente', 'status']).set_index('id')
+        kit.verificar("atualizar_status_vendas troca só o status",
+                      ok and vendas.loc[v2, 'status'] == app.STATUS_ENTREGUE and vendas.loc[v2, 'cliente'] == f"{prefixo} cliente 2")
+        ok = gestao.atualizar_status_vendas({v2: app.STATUS_FALHA_ENTREGA, v3: app.STATUS_ENTREGUE})
+        vendas = gestao.listar_vendas(colunas=['id', 'status']).set_index('id')
+        kit.verificar("atualizar_status_vendas ignora a venda removida e troca as demais",
+                      ok and vendas.loc[v2, 'status'] == app.STATUS_FALHA_ENTREGA and v3 not in vendas.index,
+                      gestao.ultimo_erro or "")
+        
+        # Vendas simultâneas: das 8 tentativas pelas 4 últimas unidades, só 4 podem dar certo
+        resultados = []
+        def vender(i):
+            resultados.append(gestao.registrar_venda(b, f"{prefixo} simultanea {i}", "", "s@medix", 1, "Pix", "2024-04-01"))
+        threads = [threading.Thread(target=vender, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        kit.verificar("vendas simultâneas não vendem além do estoque",
+                      sum(resultados) == 4 and estoque(gestao, b) == 0, f"{sum(resultados)} vendas, estoque {estoque(gestao, b)}")
+        
+        # Modo híbrido sem conexão: tudo o que foi gravado espera na fila para ir à planilha
+        if isinstance(gestao, app.GestaoVendasHibrida):
+            kit.verificar("escritas sem conexão ficam na fila de sincronização", gestao.pendentes() > 0,
+                          f"{gestao.pendentes()} alterações na fila")
+    except Exception as e:
+        logging.exception("Erro inesperado no kit de conformidade")
+        kit.verificar("roteiro executado sem exceções", False, f"{type(e).__name__}: {e}")
+    finally:
+        limpar(gestao, prefixo)
+    
+    kit.verificar_orcamentos()
+    return kit
+
+def limpar(gestao, prefixo):
+    """Marca como removidos os produtos e vendas criados pelo kit."""
+    try:
+        vendas = gestao.listar_vendas(colunas=['id', 'cliente'])
+        for id in vendas.loc[vendas['cliente'].str.startswith(prefixo), 'id']:
+            gestao.remover_venda(int(id))
+        produtos = gestao.listar_produtos(colunas=['id', 'nome'])
+        for id in produtos.loc[produtos['nome'].str.startswith(prefixo), 'id']:
+            gestao.remover_produto(int(id))
+    except Exception as e:
+        logging.error(f"Erro ao limpar os registros do kit: {e}")
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Verifica se um armazenamento do MEDIX segue a interface comum.")
+    parser.add_argument('backend', choices=sorted(ORCAMENTOS))
+    parser.add_argument('--confirmar', action='store_true',
+                        help="Necessário no Google Sheets: os registros de teste são gravados na planilha real")
+    args = parser.parse_args(argumentos)
+    if args.backend == 'sheets' and not args.confirmar:
+        parser.error("no Google Sheets o kit grava na planilha real; use --confirmar")
+    
+    diretorio = tempfile.mkdtemp(prefix='medix_conformidade_')
+    try:
+        gestao = HibridaDesconectada(diretorio) if args.backend == 'hibrido' else abrir_gestao(args.backend, diretorio)
+        kit = executar_kit(gestao, ORCAMENTOS[args.backend])
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    kit.imprimir()
+    return 0 if kit.aprovado else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,11 @@ import json
 import streamlit as st
 from google.oauth2.service_account import Credentials
 from google.oauth2 import service_account
-import tempfile
 import logging
+import threading
+import time
+from datetime import datetime, timezone
+from google.auth.transport.requests import Request
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, 
@@ -16,7 +19,74 @@ SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
 ]
 
-def get_credentials():
+# O token é renovado em segundo plano quando faltam MARGEM_RENOVACAO segundos para expirar; a margem
+# é maior que a do google-auth (que já trata o token como vencido ~4 minutos antes), então as
+# requisições nunca param para renovar. Se a renovação falhar, tenta de novo a cada ESPERA_NOVA_TENTATIVA.
+MARGEM_RENOVACAO = 5 * 60
+ESPERA_NOVA_TENTATIVA = 60
+
+# Credenciais carregadas uma única vez por processo e compartilhadas por todos os clientes
+# (gspread, Drive, Sheets): todos usam o mesmo objeto e, portanto, o mesmo token em memória
+_credenciais = None
+_lock = threading.Lock()
+_renovador = None
+
+def get_credentials(recarregar=False):
+    """
+    Retorna as credenciais do processo, carregando-as na primeira chamada (ou com recarregar=True).
+    O token é obtido logo no carregamento e mantido válido por uma thread de renovação.
+    """
+    global _credenciais
+    with _lock:
+        if _credenciais is not None and not recarregar:
+            return _credenciais
+        
+        credenciais = carregar_credenciais()
+        if credenciais is None:
+            return None
+        # Sem conexão agora, a thread de renovação tenta de novo em seguida
+        renovar_token(credenciais)
+        _credenciais = credenciais
+        iniciar_renovacao()
+        return credenciais
+
+def renovar_token(credenciais):
+    """Renova o token de acesso das credenciais; retorna True se conseguiu."""
+    try:
+        credenciais.refresh(Request())
+        logging.info(f"Token do Google renovado, válido até {credenciais.expiry} (UTC)")
+        return True
+    except Exception as e:
+        logging.warning(f"Erro ao renovar token do Google: {e}")
+        return False
+
+def segundos_ate_renovar(credenciais):
+    """Segundos até o momento de renovar o token (0 se ainda não há token ou se já passou da hora)."""
+    if not credenciais.token or credenciais.expiry is None:
+        return 0
+    # expiry do google-auth é um datetime em UTC sem fuso
+    restante = (credenciais.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+    return max(restante - MARGEM_RENOVACAO, 0)
+
+def iniciar_renovacao():
+    """Inicia, uma única vez por processo, a thread que renova o token antes de ele expirar."""
+    global _renovador
+    if _renovador is not None and _renovador.is_alive():
+        return
+    
+    def executar():
+        while True:
+            credenciais = _credenciais
+            espera = segundos_ate_renovar(credenciais)
+            if espera == 0 and not renovar_token(credenciais):
+                espera = ESPERA_NOVA_TENTATIVA
+            # Esperas curtas: acompanha credenciais recarregadas e o relógio após suspensões da máquina
+            time.sleep(min(max(espera, 1), ESPERA_NOVA_TENTATIVA))
+    
+    _renovador = threading.Thread(target=executar, name="medix-credenciais", daemon=True)
+    _renovador.start()
+
+def carregar_credenciais():
     """
     Obtém as credenciais para a API do Google, verificando diversas fontes:
     1. Segredos do Streamlit (ambiente de produção)
@@ -28,8 +98,7 @@ def get_credentials():
     if hasattr(st, 'secrets') and 'gcp_service_account' in st.secrets:
         try:
             logging.info("Tentando usar credenciais dos segredos do Streamlit")
-            # Cria um arquivo temporário com as credenciais do st.secrets para usar com from_service_account_info
-            service_account_info = st.secrets["gcp_service_account"]
+            service_account_info = dict(st.secrets["gcp_service_account"])
             
             # Verificar se a private_key está formatada corretamente
             if isinstance(service_account_info, dict) and "private_key" in service_account_info:
@@ -69,18 +138,11 @@ def get_credentials():
             except Exception as e:
                 logging.error(f"Erro ao usar credenciais do arquivo {filename}: {e}")
     
-    # 4. Criar um arquivo temporário com credenciais embutidas como último recurso
+    # 4. Credenciais embutidas nos secrets como último recurso (lidas direto, sem arquivo temporário)
     if hasattr(st, 'secrets') and 'fallback_credentials' in st.secrets:
         try:
             logging.info("Tentando usar credenciais de fallback dos secrets")
-            fallback_info = st.secrets["fallback_credentials"]
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.json')
-            with open(temp_file.name, 'w') as f:
-                json.dump(fallback_info, f)
-            
-            creds = Credentials.from_service_account_file(temp_file.name, scopes=SCOPES)
-            os.unlink(temp_file.name)  # Remover o arquivo temporário
-            return creds
+            return Credentials.from_service_account_info(dict(st.secrets["fallback_credentials"]), scopes=SCOPES)
         except Exception as e:
             logging.error(f"Erro ao usar credenciais de fallback: {e}")
     
@@ -130,10 +192,10 @@ def diagnosticar_problemas():
             try:
                 with open(arquivo, 'r') as f:
                     data = json.load(f)
-                    
+                
                 campos_obrigatorios = ["type", "project_id", "private_key_id", "private_key", 
                                       "client_email", "client_id", "auth_uri", "token_uri"]
-                                      
+                
                 for campo in campos_obrigatorios:
                     if campo not in data:
                         problemas.append(f"Campo obrigatório '{campo}' faltando no arquivo {arquivo}")
@@ -0,0 +1,274 @@
+"""Linha de comando do MEDIX para operações em lote, sem o Streamlit (ex: tarefas agendadas no cron).
+
+Uso:
+    python -m medix importar vendas_loja.csv
+    python -m medix importar produtos.xlsx --tabela produtos
+    python -m medix exportar vendas.csv --arquivadas --inicio 2024-01-01 --fim 2024-12-31
+    python -m medix backup
+    python -m medix restaurar MEDIX_backup_local_20250325_101500.json --simular
+    python -m medix relatorio relatorios.xlsx --meses 2024-01 2024-12
+    python -m medix --armazenamento sheets aquecer
+    python -m medix painel --saida /var/www/medix
+
+Arquivos de importação e exportação podem ser .csv (separador ';'), .xlsx ou .json (lista de
+objetos). Vendas importadas precisam de produto_id, cliente, quantidade e forma_pagamento e
+podem ter cpf, email e data_compra; produtos precisam de nome, tipo e valor e podem ter
+quantidade, link_download e descricao.
+
+Por padrão os comandos usam o mesmo armazenamento do aplicativo (híbrido, na pasta
+dados_hibrido) e enviam as alterações ao Google Sheets antes de terminar. Os comandos que
+gravam (importar, restaurar) não devem rodar com o aplicativo aberto na mesma pasta: use
+--diretorio para uma pasta separada nesse caso.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from contextlib import nullcontext
+
+from app import (
+    DIRETORIO_HIBRIDO, DIRETORIO_PAINEL, STATUS_REMOVIDO, GestaoVendasHibrida, PainelEstatico, concatenar_tabelas,
+    importar_dados_locais, registros_dataframe, selecionar_registros
+)
+from migracao import abrir_gestao
+from relatorios import MotorRelatorios, exportar_csv, exportar_xlsx
+import restauracao
+
+TAMANHO_LOTE_IMPORTACAO = 500
+# Nomes alternativos aceitos nas colunas dos arquivos de vendas (os das planilhas do MEDIX)
+SINONIMOS_VENDAS = {'cpf_cliente': 'cpf', 'email_cliente': 'email'}
+
+def ler_linhas(arquivo):
+    """Lê as linhas do arquivo (.csv, .xlsx ou .json) uma a uma, como dicionários de texto."""
+    extensao = os.path.splitext(arquivo)[1].lower()
+    if extensao == '.xlsx':
+        from openpyxl import load_workbook
+        livro = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            iterador = livro.worksheets[0].iter_rows(values_only=True)
+            cabecalho = [str(c).strip() if c is not None else "" for c in next(iterador, [])]
+            for linha in iterador:
+                if any(v not in (None, "") for v in linha):
+                    yield {c: ("" if v is None else v) for c, v in zip(cabecalho, linha)}
+        finally:
+            livro.close()
+    elif extensao == '.json':
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+    else:
+        with open(arquivo, 'r', newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f, delimiter=';')
+
+def argumentos_venda(linha):
+    """Converte uma linha do arquivo nos argumentos de registrar_venda (ValueError se faltar algo)."""
+    linha = {SINONIMOS_VENDAS.get(c, c): v for c, v in linha.items()}
+    faltando = [c for c in ['produto_id', 'cliente', 'quantidade', 'forma_pagamento'] if linha.get(c) in (None, "")]
+    if faltando:
+        raise ValueError(f"campos ausentes: {', '.join(faltando)}")
+    return {
+        'produto_id': int(float(linha['produto_id'])), 'cliente': str(linha['cliente']), 'cpf': str(linha.get('cpf') or ""),
+        'email': str(linha.get('email') or ""), 'quantidade': int(float(linha['quantidade'])),
+        'forma_pagamento': str(linha['forma_pagamento']), 'data_compra': linha.get('data_compra') or None
+    }
+
+def registrar_lote(gestao, vendas):
+    """Registra um lote de vendas: numa única gravação quando o armazenamento permite."""
+    if hasattr(gestao, 'registrar_vendas'):
+        return gestao.registrar_vendas(vendas)
+    return [(True, None) if gestao.registrar_venda(**venda) else (None, gestao.ultimo_erro) for venda in vendas]
+
+def importar(gestao, args):
+    gravados, falhas = 0, 0
+    
+    def falhou(posicao, motivo):
+        nonlocal falhas
+        falhas += 1
+        print(f"Linha {posicao}: {motivo}")
+    
+    if args.tabela == 'produtos':
+        # Todos os produtos numa única gravação dos arquivos, quando o armazenamento permite
+        with gestao.lote_gravacao() if hasattr(gestao, 'lote_gravacao') else nullcontext():
+            for posicao, linha in enumerate(ler_linhas(args.arquivo), start=2):
+                try:
+                    quantidade = int(float(linha['quantidade'])) if linha.get('quantidade') not in (None, "") else None
+                    ok = gestao.cadastrar_produto(str(linha['nome']), str(linha['tipo']), float(linha['valor']), quantidade,
+                                                  str(linha.get('link_download') or ""), str(linha.get('descricao') or ""))
+                except (KeyError, TypeError, ValueError) as e:
+                    falhou(posicao, f"valor inválido ou ausente ({e})")
+                    continue
+                if ok:
+                    gravados += 1
+                else:
+                    falhou(posicao, gestao.ultimo_erro)
+    else:
+        lote = []
+        
+        def gravar():
+            nonlocal gravados
+            for (posicao, _), (id, erro) in zip(lote, registrar_lote(gestao, [venda for _, venda in lote])):
+                if id:
+                    gravados += 1
+                else:
+                    falhou(posicao, erro)
+            print(f"{gravados} vendas importadas...")
+            lote.clear()
+        
+        for posicao, linha in enumerate(ler_linhas(args.arquivo), start=2):
+            try:
+                lote.append((posicao, argumentos_venda(linha)))
+            except (TypeError, ValueError) as e:
+                falhou(posicao, str(e))
+            if len(lote) >= args.lote:
+                gravar()
+        if lote:
+            gravar()
+    
+    print(f"Importação concluída ({args.tabela}): {gravados} linhas gravadas, {falhas} com problema")
+    return 0 if not falhas else 1
+
+def tabela_exportada(gestao, args):
+    if args.tabela == 'produtos':
+        return gestao.listar_produtos()
+    periodo = (args.inicio, args.fim) if args.inicio or args.fim else None
+    if periodo:
+        periodo = (periodo[0] or '1900-01-01', periodo[1] or '2999-12-31')
+    vendas = gestao.listar_vendas(periodo=periodo)
+    if args.arquivadas:
+        anos = gestao.anos_arquivados()
+        if periodo:
+            anos = [ano for ano in anos if int(periodo[0][:4]) <= ano <= int(periodo[1][:4])]
+        if anos:
+            arquivadas = selecionar_registros(gestao.listar_vendas_arquivadas(anos), periodo=periodo)
+            vendas = concatenar_tabelas([arquivadas, vendas])
+    return vendas
+
+def gravar_tabela(df, destino, aba):
+    """Grava o DataFrame no formato da extensão do destino (.csv, .xlsx ou .json)."""
+    extensao = os.path.splitext(destino)[1].lower()
+    if extensao == '.xlsx':
+        exportar_xlsx({aba: df}, destino)
+    elif extensao == '.json':
+        with open(destino, 'w', encoding='utf-8') as f:
+            json.dump(registros_dataframe(df), f, ensure_ascii=False, default=str)
+    else:
+        with open(destino, 'w', newline='', encoding='utf-8-sig') as f:
+            exportar_csv(df, f)
+
+def exportar(gestao, args):
+    df = tabela_exportada(gestao, args)
+    gravar_tabela(df, args.destino, args.tabela.capitalize())
+    print(f"{len(df)} linhas de {args.tabela} exportadas para {args.destino}")
+    return 0
+
+def backup(gestao, args):
+    arquivo = gestao.realizar_backup()
+    if not arquivo:
+        print(f"Backup não concluído: {gestao.ultimo_erro}")
+        return 1
+    print(f"Backup salvo em {arquivo}")
+    return 0
+
+def relatorio(gestao, args):
+    motor = MotorRelatorios(STATUS_REMOVIDO)
+    relatorios = {
+        'produto': ("Vendas por Produto", motor.vendas_por_produto),
+        'pagamento': ("Vendas por Pagamento", motor.vendas_por_pagamento),
+        'mes': ("Receita por Mês", motor.receita_por_mes)
+    }
+    if args.destino.lower().endswith('.xlsx'):
+        exportar_xlsx({nome: gerar(gestao, args.meses) for nome, gerar in relatorios.values()}, args.destino)
+    else:
+        nome, gerar = relatorios[args.tipo]
+        gravar_tabela(gerar(gestao, args.meses), args.destino, nome)
+    print(f"Relatório salvo em {args.destino}")
+    return 0
+
+def aquecer(gestao, args):
+    """Deixa os dados prontos para o próximo início do aplicativo (réplica local em dia) e confere a leitura."""
+    if hasattr(gestao, 'sincronizar') and not gestao.sincronizar():
+        print("Não foi possível sincronizar com o Google Sheets")
+        return 1
+    produtos, vendas = gestao.listar_produtos(colunas=['id']), gestao.listar_vendas(colunas=['id'])
+    print(f"Dados prontos: {len(produtos)} produtos e {len(vendas)} vendas")
+    quarentena = gestao.relatorio_quarentena()
+    if not quarentena.empty:
+        print(f"Aviso: {len(quarentena)} linhas com valores inválidos em quarentena")
+    return 0
+
+def painel(gestao, args):
+    """Grava o painel somente leitura (HTML estático) para ser servido por qualquer servidor de arquivos."""
+    publicador = PainelEstatico(args.saida)
+    publicador.publicar(gestao, forcar=True)
+    print(f"Painel salvo em {publicador.arquivo}")
+    return 0
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(prog="python -m medix", description="Operações em lote do MEDIX pela linha de comando.")
+    parser.add_argument('--armazenamento', choices=['local', 'parquet', 'sheets', 'hibrido'], default='hibrido',
+                        help="Armazenamento usado (padrão: o híbrido do aplicativo)")
+    parser.add_argument('--diretorio', help=f"Pasta dos arquivos locais (padrão: '{DIRETORIO_HIBRIDO}' no modo híbrido, '.' nos outros)")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    
+    comando = comandos.add_parser('importar', help="Importa vendas ou produtos de um arquivo")
+    comando.add_argument('arquivo', help="Arquivo .csv, .xlsx ou .json")
+    comando.add_argument('--tabela', choices=['vendas', 'produtos'], default='vendas')
+    comando.add_argument('--lote', type=int, default=TAMANHO_LOTE_IMPORTACAO, help="Vendas por gravação")
+    comando.set_defaults(executar=importar)
+    
+    comando = comandos.add_parser('exportar', help="Exporta vendas ou produtos para um arquivo")
+    comando.add_argument('destino', help="Arquivo .csv, .xlsx ou .json")
+    comando.add_argument('--tabela', choices=['vendas', 'produtos'], default='vendas')
+    comando.add_argument('--inicio', help="Data de compra inicial (AAAA-MM-DD)")
+    comando.add_argument('--fim', help="Data de compra final (AAAA-MM-DD)")
+    comando.add_argument('--arquivadas', action='store_true', help="Inclui as vendas arquivadas")
+    comando.set_defaults(executar=exportar)
+    
+    comando = comandos.add_parser('backup', help="Salva um backup dos dados atuais")
+    comando.set_defaults(executar=backup)
+    
+    comando = comandos.add_parser('restaurar', help="Restaura um backup (ver restauracao.py)")
+    comando.add_argument('arquivo', help="Backup .json (modo local) ou .xlsx (Google Sheets)")
+    comando.add_argument('--simular', action='store_true', help="Só mostra o que mudaria, sem gravar")
+    comando.add_argument('--sem-backup', action='store_true', help="Não salva os dados atuais antes de restaurar")
+    
+    comando = comandos.add_parser('relatorio', help="Gera os relatórios de vendas")
+    comando.add_argument('destino', help="Arquivo .xlsx (todos os relatórios) ou .csv/.json (um relatório)")
+    comando.add_argument('--tipo', choices=['produto', 'pagamento', 'mes'], default='produto',
+                         help="Relatório gravado em .csv/.json")
+    comando.add_argument('--meses', nargs=2, metavar=('INICIO', 'FIM'), help="Meses (AAAA-MM) incluídos")
+    comando.set_defaults(executar=relatorio)
+    
+    comando = comandos.add_parser('aquecer', help="Sincroniza a réplica local e confere a leitura dos dados")
+    comando.set_defaults(executar=aquecer)
+    
+    comando = comandos.add_parser('painel', help="Grava o dashboard somente leitura em HTML estático")
+    comando.add_argument('--saida', default=DIRETORIO_PAINEL, help="Pasta do painel.html (padrão: static/ ao lado do app)")
+    comando.set_defaults(executar=painel)
+    
+    args = parser.parse_args(argumentos)
+    diretorio = args.diretorio or (DIRETORIO_HIBRIDO if args.armazenamento == 'hibrido' else '.')
+    if args.armazenamento == 'hibrido' and not args.diretorio:
+        # Como em criar_gestao_hibrida: os dados do antigo modo local vêm junto na primeira execução
+        importar_dados_locais(diretorio)
+    
+    if args.comando == 'restaurar':
+        return restauracao.main([args.arquivo, '--destino', args.armazenamento, '--diretorio', diretorio] +
+                                (['--simular'] if args.simular else []) + (['--sem-backup'] if args.sem_backup else []))
+    
+    try:
+        gestao = abrir_gestao(args.armazenamento, diretorio)
+        resultado = args.executar(gestao, args)
+        # No modo híbrido as alterações só ficam seguras na planilha depois de enviadas
+        if isinstance(gestao, GestaoVendasHibrida) and gestao.pendentes():
+            if not gestao.sincronizar() or gestao.pendentes():
+                print(f"{gestao.pendentes()} alterações ficaram na fila local ({diretorio}) e serão enviadas na próxima execução")
+        return resultado
+    except Exception as e:
+        logging.error(f"Erro no comando {args.comando}: {e}")
+        print(f"Comando {args.comando} não concluído: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Migração em lote de produtos e vendas entre armazenamentos (arquivos locais, Parquet e Google Sheets).
+
+Uso:
+    python migracao.py local sheets
+    python migracao.py sheets local --diretorio-destino copia_local
+    python migracao.py local sheets --lote 1000 --recomecar
+    python migracao.py local parquet --diretorio-origem dados_hibrido --diretorio-destino dados_hibrido
+
+Os registros são lidos e gravados em lotes, mantendo IDs e estoques. O progresso é
+salvo em um checkpoint após cada lote: se a execução for interrompida, basta rodar o
+mesmo comando de novo para continuar de onde parou.
+
+Migrar de 'local' para 'parquet' na mesma pasta converte as vendas dela para Parquet; a
+partir daí o aplicativo passa a usar o armazenamento em Parquet nessa pasta.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from app import (
+    COLUNAS_PRODUTOS, COLUNAS_VENDAS, GestaoVendasGoogleSheets, GestaoVendasHibrida, GestaoVendasLocal,
+    GestaoVendasParquet, parquet_disponivel, registro_ativo, registros_dataframe
+)
+
+ARQUIVO_CHECKPOINT = 'migracao_checkpoint.json'
+TAMANHO_LOTE = 500
+
+def abrir_gestao(tipo, diretorio='.'):
+    """Abre o armazenamento pedido ('local', 'parquet', 'sheets' ou 'hibrido', com a pasta local dele)."""
+    if tipo == 'hibrido':
+        gestao = GestaoVendasHibrida(diretorio)
+        # Fora do aplicativo a primeira sincronização é esperada: os comandos leem os dados atuais
+        gestao.sincronizar(esperar=True)
+        return gestao
+    if tipo == 'local':
+        return GestaoVendasLocal(diretorio)
+    if tipo == 'parquet':
+        if not parquet_disponivel:
+            raise RuntimeError("O armazenamento em Parquet precisa do pacote pyarrow.")
+        return GestaoVendasParquet(diretorio)
+    gestao = GestaoVendasGoogleSheets()
+    if not gestao.autenticado:
+        raise RuntimeError("Não foi possível conectar ao Google Sheets. Verifique as credenciais.")
+    return gestao
+
+def ler_lote(gestao, tabela, inicio, fim):
+    """Lê os registros [inicio, fim) de uma tabela, incluindo os removidos para manter as posições estáveis.
+    
+    No Google Sheets a leitura vai direto à planilha para que um erro interrompa a migração
+    em vez de parecer o fim dos dados.
+    """
+    if isinstance(gestao, GestaoVendasGoogleSheets):
+        if tabela == 'produtos':
+            df = gestao.ler_intervalo(gestao.produtos_sheet, gestao.cabecalho_produtos or COLUNAS_PRODUTOS, linhas=(inicio, fim))
+            df = gestao.converter_tipos_produtos(df)
+        else:
+            df = gestao.ler_intervalo(gestao.vendas_sheet, gestao.cabecalho_vendas or COLUNAS_VENDAS, linhas=(inicio, fim))
+            df = gestao.converter_tipos_vendas(df)
+    elif tabela == 'produtos':
+        df = gestao.listar_produtos(linhas=(inicio, fim), incluir_removidos=True)
+    else:
+        df = gestao.listar_vendas(linhas=(inicio, fim), incluir_removidos=True)
+    return registros_dataframe(df)
+
+def carregar_checkpoint(chave):
+    if not os.path.exists(ARQUIVO_CHECKPOINT):
+        return {}
+    with open(ARQUIVO_CHECKPOINT, 'r') as f:
+        return json.load(f).get(chave, {})
+
+def salvar_checkpoint(chave, progresso):
+    checkpoints = {}
+    if os.path.exists(ARQUIVO_CHECKPOINT):
+        with open(ARQUIVO_CHECKPOINT, 'r') as f:
+            checkpoints = json.load(f)
+    checkpoints[chave] = progresso
+    temporario = f"{ARQUIVO_CHECKPOINT}.tmp"
+    with open(temporario, 'w') as f:
+        json.dump(checkpoints, f, indent=2)
+    os.replace(temporario, ARQUIVO_CHECKPOINT)
+
+def migrar(origem, destino, chave, tamanho_lote=TAMANHO_LOTE, recomecar=False):
+    """Copia produtos e depois vendas da origem para o destino, lote a lote.
+    
+    Registros removidos (ainda não compactados) não são copiados. A gravação é feita por ID,
+    então repetir um lote já gravado não duplica registros.
+    """
+    progresso = {} if recomecar else carregar_checkpoint(chave)
+    totais = {}
+    inicio_migracao = time.monotonic()
+    
+    # Produtos primeiro: as vendas fazem referência a eles
+    for tabela in ['produtos', 'vendas']:
+        estado = progresso.setdefault(tabela, {'posicao': 0, 'gravados': 0, 'concluido': False})
+        if estado['concluido']:
+            print(f"{tabela}: já migrados ({estado['gravados']} registros)")
+            totais[tabela] = 0
+            continue
+        
+        gravados = 0
+        inicio_tabela = time.monotonic()
+        while True:
+            registros = ler_lote(origem, tabela, estado['posicao'], estado['posicao'] + tamanho_lote)
+            if not registros:
+                break
+            ativos = [r for r in registros if registro_ativo(r)]
+            destino.gravar_registros(tabela, ativos)
+            
+            gravados += len(ativos)
+            estado['posicao'] += len(registros)
+            estado['gravados'] += len(ativos)
+            salvar_checkpoint(chave, progresso)
+            
+            decorrido = time.monotonic() - inicio_tabela
+            print(f"{tabela}: {estado['posicao']} lidos, {estado['gravados']} gravados "
+                  f"({gravados / decorrido if decorrido else 0:.0f} registros/s)")
+        
+        estado['concluido'] = True
+        salvar_checkpoint(chave, progresso)
+        totais[tabela] = gravados
+    
+    decorrido = time.monotonic() - inicio_migracao
+    total = sum(totais.values())
+    print(f"Migração concluída: {totais.get('produtos', 0)} produtos e {totais.get('vendas', 0)} vendas "
+          f"em {decorrido:.1f}s ({total / decorrido if decorrido else 0:.0f} registros/s)")
+    return totais
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Migra produtos e vendas entre armazenamentos do MEDIX.")
+    parser.add_argument('origem', choices=['local', 'parquet', 'sheets'])
+    parser.add_argument('destino', choices=['local', 'parquet', 'sheets'])
+    parser.add_argument('--diretorio-origem', default='.', help="Pasta dos arquivos locais de origem")
+    parser.add_argument('--diretorio-destino', default='.', help="Pasta dos arquivos locais de destino")
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help="Registros por lote")
+    parser.add_argument('--recomecar', action='store_true', help="Ignora o checkpoint e migra tudo de novo")
+    args = parser.parse_args(argumentos)
+    
+    if args.origem == args.destino and (args.origem == 'sheets' or
+                                        os.path.abspath(args.diretorio_origem) == os.path.abspath(args.diretorio_destino)):
+        parser.error("origem e destino são o mesmo armazenamento")
+    
+    try:
+        origem = abrir_gestao(args.origem, args.diretorio_origem)
+        destino = abrir_gestao(args.destino, args.diretorio_destino)
+        chave = f"{args.origem}:{os.path.abspath(args.diretorio_origem) if args.origem != 'sheets' else ''}->" \
+                f"{args.destino}:{os.path.abspath(args.diretorio_destino) if args.destino != 'sheets' else ''}"
+        migrar(origem, destino, chave, args.lote, args.recomecar)
+        return 0
+    except Exception as e:
+        logging.error(f"Erro na migração: {e}")
+        print(f"Migração interrompida: {e}. Rode o mesmo comando para continuar do último lote gravado.")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
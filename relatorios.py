@@ -0,0 +1,132 @@
+"""Relatórios de vendas calculados a partir de um cubo de agregados, com exportação para XLSX e CSV.
+
+O cubo guarda, por mês × produto × forma de pagamento × status, o número de vendas, as
+unidades e o valor. Vendas por produto, por forma de pagamento e receita por mês são
+agrupamentos do cubo (algumas milhares de linhas), não do histórico de vendas inteiro.
+
+Este módulo não importa o app: recebe o armazenamento (ver ArmazenamentoVendas em app.py)
+e o status dos registros removidos de quem o usa.
+"""
+import csv
+import threading
+
+import pandas as pd
+
+DIMENSOES_CUBO = ['mes', 'produto_id', 'produto_nome', 'forma_pagamento', 'status']
+MEDIDAS_CUBO = ['vendas', 'quantidade', 'valor_total']
+SEM_DATA = 'Sem data'
+
+def agregar_vendas(vendas):
+    """Agrupa vendas (data_compra, produto_id, produto_nome, forma_pagamento, status, quantidade, valor_total) no formato do cubo."""
+    if vendas.empty:
+        return pd.DataFrame(columns=DIMENSOES_CUBO + MEDIDAS_CUBO)
+    chaves = {
+        'mes': vendas['data_compra'].dt.strftime("%Y-%m").fillna(SEM_DATA),
+        'produto_id': vendas['produto_id'],
+        'produto_nome': vendas['produto_nome'].astype(str),
+        'forma_pagamento': vendas['forma_pagamento'].astype(str),
+        'status': vendas['status'].astype(str)
+    }
+    agrupado = vendas.groupby([serie.rename(nome) for nome, serie in chaves.items()], dropna=False)
+    return agrupado.agg(
+        vendas=('valor_total', 'size'), quantidade=('quantidade', 'sum'), valor_total=('valor_total', 'sum')
+    ).reset_index()
+
+class MotorRelatorios:
+    """Cubo de agregados das vendas, atualizado por partes, e os relatórios servidos a partir dele.
+
+    As vendas ativas são reagrupadas só quando versao_dados() muda; cada ano arquivado só é
+    relido quando o total dele no resumo do arquivo muda (ou seja, quando recebeu vendas).
+    """
+
+    def __init__(self, status_removido):
+        self.status_removido = status_removido
+        self._versao = None
+        self._ativas = agregar_vendas(pd.DataFrame())
+        # {ano: (número de vendas no resumo do arquivo, agregado do ano)}
+        self._arquivadas = {}
+        self._cubo = None
+        self._lock = threading.Lock()
+
+    def atualizar(self, gestao):
+        """Traz o cubo para a versão atual dos dados e o retorna."""
+        with self._lock:
+            alterado = False
+            versao = gestao.versao_dados()
+            if versao != self._versao:
+                colunas = ['data_compra', 'produto_id', 'produto_nome', 'forma_pagamento', 'status', 'quantidade', 'valor_total']
+                self._ativas = agregar_vendas(gestao.listar_vendas(colunas=colunas, incluir_removidos=True))
+                self._versao = versao
+                alterado = True
+
+            resumo = gestao.resumo_arquivo()
+            totais = resumo.groupby(resumo['periodo'].str[:4].astype(int))['vendas'].sum().to_dict() if not resumo.empty else {}
+            for ano in set(self._arquivadas) - set(totais):
+                del self._arquivadas[ano]
+                alterado = True
+            for ano, total in totais.items():
+                if ano not in self._arquivadas or self._arquivadas[ano][0] != total:
+                    vendas = gestao.listar_vendas_arquivadas([ano])
+                    self._arquivadas[ano] = (total, agregar_vendas(vendas))
+                    alterado = True
+
+            if alterado or self._cubo is None:
+                partes = [self._ativas] + [agregado for _, agregado in self._arquivadas.values()]
+                partes = [parte for parte in partes if not parte.empty]
+                cubo = pd.concat(partes, ignore_index=True) if partes else self._ativas
+                # Um mês pode estar em parte arquivado e em parte ativo: soma as duas partes
+                self._cubo = cubo.groupby(DIMENSOES_CUBO, dropna=False)[MEDIDAS_CUBO].sum().reset_index()
+            return self._cubo
+
+    def filtrar(self, gestao, meses=None):
+        """Linhas do cubo das vendas não removidas, com meses=(inicio, fim) no formato AAAA-MM (inclusive)."""
+        cubo = self.atualizar(gestao)
+        cubo = cubo[cubo['status'] != self.status_removido]
+        if meses:
+            cubo = cubo[(cubo['mes'] >= meses[0]) & (cubo['mes'] <= meses[1])]
+        return cubo
+
+    def vendas_por_produto(self, gestao, meses=None):
+        cubo = self.filtrar(gestao, meses)
+        relatorio = cubo.groupby('produto_nome')[MEDIDAS_CUBO].sum().reset_index()
+        total = relatorio['valor_total'].sum()
+        relatorio['participacao'] = (relatorio['valor_total'] / total * 100 if total else 0.0)
+        return relatorio.sort_values('valor_total', ascending=False).reset_index(drop=True)
+
+    def vendas_por_pagamento(self, gestao, meses=None):
+        cubo = self.filtrar(gestao, meses)
+        relatorio = cubo.groupby('forma_pagamento')[MEDIDAS_CUBO].sum().reset_index()
+        relatorio['ticket_medio'] = relatorio['valor_total'] / relatorio['vendas'].where(relatorio['vendas'] > 0)
+        return relatorio.sort_values('valor_total', ascending=False).reset_index(drop=True)
+
+    def receita_por_mes(self, gestao, meses=None):
+        cubo = self.filtrar(gestao, meses)
+        return cubo.groupby('mes')[MEDIDAS_CUBO].sum().reset_index().sort_values('mes').reset_index(drop=True)
+
+def valor_exportado(valor):
+    """Valor pronto para a planilha/CSV: vazio para NaN/NaT e tipos do numpy convertidos para Python."""
+    if pd.isna(valor):
+        return None
+    return valor.item() if hasattr(valor, 'item') else valor
+
+def exportar_xlsx(relatorios, destino):
+    """Grava cada relatório ({nome da aba: DataFrame}) numa aba do arquivo ou buffer `destino`.
+
+    O openpyxl em modo write_only escreve linha a linha, sem montar a planilha na memória.
+    """
+    from openpyxl import Workbook
+
+    planilha = Workbook(write_only=True)
+    for nome, relatorio in relatorios.items():
+        aba = planilha.create_sheet(title=nome[:31])
+        aba.append(list(relatorio.columns))
+        for linha in relatorio.itertuples(index=False, name=None):
+            aba.append([valor_exportado(valor) for valor in linha])
+    planilha.save(destino)
+
+def exportar_csv(relatorio, destino):
+    """Grava o relatório como CSV (separador ';', como o Excel em português espera) num arquivo de texto aberto."""
+    escritor = csv.writer(destino, delimiter=';')
+    escritor.writerow(relatorio.columns)
+    for linha in relatorio.itertuples(index=False, name=None):
+        escritor.writerow(["" if valor_exportado(valor) is None else valor_exportado(valor) for valor in linha])
@@ -0,0 +1,53 @@
+"""Restauração de backups do MEDIX pela linha de comando.
+
+Uso:
+    python restauracao.py MEDIX_backup_local_20250325_101500.json --simular
+    python restauracao.py MEDIX_backup_20250325_101500.xlsx --destino sheets
+
+O backup é validado linha a linha (linhas inválidas são listadas e ignoradas) e comparado
+com os dados atuais. Sem --simular, os dados atuais são salvos em um novo backup e
+substituídos pelos do arquivo em uma única escrita em massa.
+"""
+import argparse
+import logging
+import sys
+
+from app import comparar_backup, ler_backup
+from migracao import abrir_gestao
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Restaura um backup de produtos e vendas do MEDIX.")
+    parser.add_argument('arquivo', help="Backup .json (modo local) ou .xlsx (Google Sheets)")
+    parser.add_argument('--destino', choices=['local', 'parquet', 'sheets', 'hibrido'], default='local')
+    parser.add_argument('--diretorio', default='.', help="Pasta dos arquivos locais de destino")
+    parser.add_argument('--simular', action='store_true', help="Só mostra o que mudaria, sem gravar")
+    parser.add_argument('--sem-backup', action='store_true', help="Não salva os dados atuais antes de restaurar")
+    args = parser.parse_args(argumentos)
+    
+    try:
+        backup, problemas = ler_backup(args.arquivo)
+        for problema in problemas:
+            print(f"Aviso: {problema}")
+        
+        gestao = abrir_gestao(args.destino, args.diretorio)
+        for tabela, diferenca in comparar_backup(gestao, backup).items():
+            print(f"{tabela}: {diferenca['novos']} novos, {diferenca['alterados']} alterados, "
+                  f"{diferenca['removidos']} apagados, {diferenca['iguais']} iguais")
+        if args.simular:
+            return 0
+        
+        if not args.sem_backup:
+            arquivo_atual = gestao.realizar_backup()
+            if not arquivo_atual:
+                raise RuntimeError("não foi possível fazer o backup dos dados atuais")
+            print(f"Dados atuais salvos em {arquivo_atual}")
+        gestao.substituir_dados(backup['produtos'], backup['vendas'])
+        print(f"Backup restaurado: {len(backup['produtos'])} produtos e {len(backup['vendas'])} vendas")
+        return 0
+    except Exception as e:
+        logging.error(f"Erro ao restaurar backup: {e}")
+        print(f"Restauração não concluída: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())